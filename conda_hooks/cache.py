@@ -0,0 +1,445 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import http.client
+import json
+import logging
+import os
+import re
+import subprocess
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Iterable, Sequence
+
+LOGGER = logging.getLogger(__name__)
+"""A logger to use throughout the module."""
+
+CACHE_DIR_NAME = "conda-hooks"
+"""Name of the cache directory inside the common git directory."""
+
+DEFAULT_TTL = 30 * 24 * 60 * 60.0
+"""Default time to live of cache entries in seconds (30 days)."""
+
+TMP_FILE_MAX_AGE = 60 * 60.0
+"""Age in seconds after which leftover temporary files of the cache are removed."""
+
+REQUESTED_SPECS_REGEX = re.compile(r"#\s*(\w+)\s*specs:\s*(.+)?")
+"""Regex of the lines of ``conda-meta/history`` that record specs (as used by conda)."""
+
+
+def get_git_common_dir(path: Path | str) -> Path | None:
+    """Find the git directory shared by all worktrees of the repository.
+
+    Args:
+        path: File or directory inside the repository.
+
+    Returns:
+        Path of the common git directory or ``None`` if the path is not inside a
+        git repository.
+    """
+    path = Path(path).resolve()
+    directory = path if path.is_dir() else path.parent
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "--git-common-dir"],
+            cwd=directory,
+            stderr=subprocess.DEVNULL,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return (directory / output.decode().strip()).resolve()
+
+
+def get_blob_hash(path: Path | str) -> str:
+    """Compute the git blob hash of a file (like ``git hash-object``).
+
+    Args:
+        path: Path of the file.
+
+    Returns:
+        Hexadecimal SHA-1 of the blob.
+    """
+    data = Path(path).read_bytes()
+    digest = hashlib.sha1(f"blob {len(data)}\0".encode())
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def get_prefix_fingerprint(prefix: Path | str) -> str:
+    """Compute a fingerprint of the packages installed in a conda prefix.
+
+    The fingerprint is based on the names of the package records in
+    ``<prefix>/conda-meta`` which encode name, version and build of each package.
+    Therefore, it is identical for identical environments on different machines.
+
+    Args:
+        prefix: Path of the conda environment.
+
+    Returns:
+        Hexadecimal SHA-256 of the ``conda-meta`` records.
+    """
+    digest = hashlib.sha256()
+    for record in sorted((Path(prefix) / "conda-meta").glob("*.json")):
+        digest.update(f"{record.name}\n".encode())
+    return digest.hexdigest()
+
+
+def get_requested_specs_fingerprint(prefix: Path | str) -> str:
+    """Compute a fingerprint of the specs requested by the user in a conda prefix.
+
+    ``conda env export --from-history`` is based on the specs recorded in
+    ``<prefix>/conda-meta/history``. Only these lines are considered (and not the
+    timestamps), so that the fingerprint is identical on different machines.
+
+    Args:
+        prefix: Path of the conda environment.
+
+    Returns:
+        Hexadecimal SHA-256 of the requested specs.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(Path(prefix) / "conda-meta" / "history") as fptr:
+            for line in fptr:
+                if REQUESTED_SPECS_REGEX.match(line):
+                    digest.update(line.strip().encode() + b"\n")
+    except OSError:
+        pass
+    return digest.hexdigest()
+
+
+class CacheBackend(ABC):
+    """Interface of a key-value store used by :class:`ResultCache`.
+
+    Values are JSON-serializable dictionaries. Backends have to handle expiration of
+    entries themselves and must not raise on connection or I/O errors but treat
+    them as cache misses.
+    """
+
+    @abstractmethod
+    def get_many(self, keys: Sequence[str]) -> dict[str, dict[str, Any]]:
+        """Fetch multiple entries at once.
+
+        Args:
+            keys: Keys to look up.
+
+        Returns:
+            Mapping from keys to values of all entries that were found and did not
+            expire yet.
+        """
+
+    @abstractmethod
+    def put(self, key: str, value: dict[str, Any], ttl: float | None = None):
+        """Store an entry.
+
+        Args:
+            key: Key of the entry.
+            value: Value of the entry.
+            ttl: Time to live in seconds (``None`` to keep the entry forever).
+        """
+
+    def evict_expired(self):
+        """Remove all expired entries from the store (if supported by the backend)."""
+
+
+def _make_entry(value: dict[str, Any], ttl: float | None) -> dict[str, Any]:
+    return {"value": value, "expires": None if ttl is None else time.time() + ttl}
+
+
+def _is_valid_entry(entry: Any) -> bool:
+    return (
+        isinstance(entry, dict)
+        and isinstance(entry.get("value"), dict)
+        and isinstance(entry.get("expires"), (int, float, type(None)))
+    )
+
+
+def _is_expired(entry: dict[str, Any]) -> bool:
+    return (entry.get("expires") is not None) and (time.time() >= entry["expires"])
+
+
+class LocalCacheBackend(CacheBackend):
+    """Cache backend storing each entry as a file in a local directory.
+
+    Entries are written atomically, so that multiple processes can safely use the
+    same directory in parallel. Expired entries are removed when they are read and by
+    :meth:`evict_expired`.
+    """
+
+    def __init__(self, directory: Path | str):
+        self.directory = Path(directory)
+
+    def _get_entry_path(self, key: str) -> Path:
+        return self.directory / key[:2] / key[2:]
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, dict[str, Any]]:
+        result: dict[str, dict[str, Any]] = {}
+        for key in keys:
+            path = self._get_entry_path(key)
+            try:
+                with open(path) as fptr:
+                    entry = json.load(fptr)
+            except (OSError, ValueError):
+                continue
+
+            if (not _is_valid_entry(entry)) or _is_expired(entry):
+                LOGGER.debug(f"evict expired cache entry: {path}")
+                with contextlib.suppress(OSError):
+                    path.unlink()
+                continue
+
+            result[key] = entry["value"]
+        return result
+
+    def put(self, key: str, value: dict[str, Any], ttl: float | None = None):
+        path = self._get_entry_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        except OSError as e:
+            LOGGER.warning(f"failed to write cache entry {path}: {e}")
+            return
+
+        try:
+            with os.fdopen(fd, "w") as fptr:
+                json.dump(_make_entry(value, ttl), fptr)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            LOGGER.warning(f"failed to write cache entry {path}: {e}")
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+
+    def evict_expired(self):
+        if not self.directory.is_dir():
+            return
+
+        now = time.time()
+        for path in self.directory.glob("*/*"):
+            with contextlib.suppress(OSError):
+                if path.name.startswith(".tmp-"):
+                    if now - path.stat().st_mtime >= TMP_FILE_MAX_AGE:
+                        path.unlink()
+                    continue
+
+                try:
+                    with open(path) as fptr:
+                        entry = json.load(fptr)
+                    expired = (not _is_valid_entry(entry)) or _is_expired(entry)
+                except ValueError:
+                    expired = True
+
+                if expired:
+                    LOGGER.debug(f"evict expired cache entry: {path}")
+                    path.unlink()
+
+
+class HttpCacheBackend(CacheBackend):
+    """Cache backend using a remote HTTP(S) server.
+
+    Entries are stored as JSON objects with ``PUT <url>/<key>``. All entries of a run
+    are fetched in a single round trip with ``POST <url>/_batch`` and a JSON body
+    ``{"keys": [...]}``, the server responds with a JSON object mapping the keys it
+    found to the stored entries. If the server does not provide this endpoint
+    (``404``/``405``, e.g. a plain S3-compatible object store), each entry is fetched
+    with ``GET <url>/<key>`` instead. An ``Authorization`` header can be sent with
+    each request, stores that require signed requests (like AWS S3 itself) need a
+    gateway or pre-authorized URL.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 10.0,
+        authorization: str | None = None,
+    ):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self.authorization = authorization
+        self.batch_supported = True
+
+    def _request(self, method: str, path: str, body: Any = None) -> bytes:
+        headers = {"Content-Type": "application/json"}
+        if self.authorization:
+            headers["Authorization"] = self.authorization
+
+        request = urllib.request.Request(
+            f"{self.url}/{path}",
+            data=None if body is None else json.dumps(body).encode(),
+            headers=headers,
+            method=method,
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+    def _get_batch(self, keys: Sequence[str]) -> Any:
+        try:
+            return json.loads(self._request("POST", "_batch", {"keys": list(keys)}))
+        except urllib.error.HTTPError as e:
+            if e.code not in (404, 405):
+                raise
+            LOGGER.debug(f"cache {self.url} does not support batch requests")
+            self.batch_supported = False
+            return self._get_each(keys)
+
+    def _get_each(self, keys: Sequence[str]) -> dict[str, Any]:
+        entries: dict[str, Any] = {}
+        for key in keys:
+            try:
+                entries[key] = json.loads(self._request("GET", key))
+            except urllib.error.HTTPError as e:
+                if e.code != 404:
+                    raise
+        return entries
+
+    def get_many(self, keys: Sequence[str]) -> dict[str, dict[str, Any]]:
+        if not keys:
+            return {}
+
+        try:
+            if self.batch_supported:
+                entries = self._get_batch(keys)
+            else:
+                entries = self._get_each(keys)
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            LOGGER.warning(f"failed to fetch cache entries from {self.url}: {e}")
+            return {}
+
+        if not isinstance(entries, dict):
+            LOGGER.warning(f"invalid response from cache {self.url}")
+            return {}
+
+        requested = set(keys)
+        result: dict[str, dict[str, Any]] = {}
+        for key, entry in entries.items():
+            if (key in requested) and _is_valid_entry(entry) and not _is_expired(entry):
+                result[key] = entry["value"]
+        return result
+
+    def put(self, key: str, value: dict[str, Any], ttl: float | None = None):
+        try:
+            self._request("PUT", key, _make_entry(value, ttl))
+        except (OSError, http.client.HTTPException) as e:
+            LOGGER.warning(f"failed to store cache entry on {self.url}: {e}")
+
+
+def create_backend(
+    location: Path | str,
+    authorization: str | None = None,
+) -> CacheBackend:
+    """Create a cache backend from a URL or path.
+
+    Args:
+        location: ``http://`` or ``https://`` URL of a remote cache or path of a local
+            directory.
+        authorization: Value of the ``Authorization`` header sent to a remote cache.
+
+    Returns:
+        The cache backend.
+    """
+    if str(location).startswith(("http://", "https://")):
+        return HttpCacheBackend(str(location), authorization=authorization)
+    return LocalCacheBackend(location)
+
+
+class ResultCache:
+    """Cache of environment files that are known to be up-to-date.
+
+    Entries are looked up in bulk with :meth:`fetch` before checking them with
+    ``in`` so that remote backends need only a single round trip per run.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float | None = DEFAULT_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.known_keys: set[str] = set()
+        self.fetched_keys: set[str] = set()
+
+    @staticmethod
+    def get_key(env_file_path: Path | str, prefix: Path | str, pin: bool) -> str:
+        """Compute the cache key for an environment file and conda environment.
+
+        Args:
+            env_file_path: Path of the environment file.
+            prefix: Path of the conda environment.
+            pin: Whether the file is checked in pinning mode.
+
+        Returns:
+            Hexadecimal cache key.
+        """
+        parts = [get_blob_hash(env_file_path), get_prefix_fingerprint(prefix)]
+        if pin:
+            parts.append("pin")
+        else:
+            parts += ["history", get_requested_specs_fingerprint(prefix)]
+        return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+    def fetch(self, keys: Iterable[str]):
+        """Look up multiple keys in the backend at once.
+
+        Args:
+            keys: Cache keys as returned by :meth:`get_key`.
+        """
+        keys = [key for key in keys if key not in self.fetched_keys]
+        if keys:
+            self.known_keys.update(self.backend.get_many(keys))
+            self.fetched_keys.update(keys)
+
+    def __contains__(self, key: str) -> bool:
+        self.fetch([key])
+        return key in self.known_keys
+
+    def add(self, key: str, name: str):
+        """Mark a result as up-to-date.
+
+        Args:
+            key: Cache key as returned by :meth:`get_key`.
+            name: Name of the environment (stored for debugging purposes).
+        """
+        self.backend.put(key, {"name": name}, self.ttl)
+        self.known_keys.add(key)
+
+    def evict_expired(self):
+        """Remove expired entries from the backend."""
+        self.backend.evict_expired()
+
+
+def get_cache_location(env_file_path: Path | str) -> Path | None:
+    """Get the directory of the result cache shared by all worktrees.
+
+    Args:
+        env_file_path: Path of the environment file.
+
+    Returns:
+        The cache directory or ``None`` if the file is not inside a git repository.
+    """
+    git_dir = get_git_common_dir(env_file_path)
+    if git_dir is None:
+        return None
+
+    return git_dir / CACHE_DIR_NAME / "results"
+
+
+def get_result_cache(
+    env_file_path: Path | str,
+    ttl: float | None = DEFAULT_TTL,
+) -> ResultCache | None:
+    """Get the result cache shared by all worktrees of the repository.
+
+    Args:
+        env_file_path: Path of the environment file.
+        ttl: Time to live of new entries in seconds.
+
+    Returns:
+        The cache or ``None`` if the file is not inside a git repository.
+    """
+    location = get_cache_location(env_file_path)
+    if location is None:
+        return None
+
+    return ResultCache(LocalCacheBackend(location), ttl)
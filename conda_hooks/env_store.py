@@ -6,7 +6,8 @@ import os
 from pathlib import Path
 from typing import Sequence
 
-from .environment import ENV_DEFAULT_PATHS, EnvironmentFile
+from .cache import DEFAULT_TTL, ResultCache, create_backend, get_cache_location
+from .environment import ENV_DEFAULT_PATHS, EnvironmentFile, get_env_prefixes
 from .errors import CondaHookError, EnvFileNotFoundError, NoEnvFileError, NotAFileError
 
 logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"))
@@ -31,6 +32,39 @@ def get_argument_parser() -> argparse.ArgumentParser:
             " (can be specified multiple times)."
         ),
     )
+    parser.add_argument(
+        "-p",
+        "--pin",
+        action="store_true",
+        help=(
+            "Pin all installed packages (including transitive dependencies)"
+            " with their exact version and build."
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=(
+            "Do not use the result cache shared by all worktrees"
+            " of the git repository."
+        ),
+    )
+    parser.add_argument(
+        "--cache-url",
+        type=str,
+        default=os.environ.get("CONDA_HOOKS_CACHE_URL"),
+        help=(
+            "URL of a remote (http/https) cache or path of a cache directory"
+            " shared between runs, instead of the cache in the git directory"
+            " (default: $CONDA_HOOKS_CACHE_URL)."
+        ),
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_TTL,
+        help="Time to live of new cache entries in seconds.",
+    )
     parser.add_argument(
         "files",
         type=Path,
@@ -56,7 +90,8 @@ def get_env_files(args: argparse.Namespace) -> list[Path]:
     if not files:
         files = [file for file in ENV_DEFAULT_PATHS if file.exists() and file.is_file()]
 
-    return [file.resolve() for file in files]
+    # a file can be matched multiple times (e.g. by a pattern and explicitly)
+    return list(dict.fromkeys(file.resolve() for file in files))
 
 
 def main(argv: Sequence[str] | None = None):
@@ -68,23 +103,73 @@ def main(argv: Sequence[str] | None = None):
         if not files:
             raise NoEnvFileError()
 
+        # resolve all environments with a single call to conda
+        prefixes = get_env_prefixes()
+
+        caches: dict[str, ResultCache] = {}
+        keys: dict[str, list[str]] = {}
+        jobs: list[
+            tuple[Path, EnvironmentFile, Path | None, ResultCache | None, str | None]
+        ] = []
         for file in files:
             env = EnvironmentFile(file)
-            new_env = EnvironmentFile(file)
+            prefix = prefixes.get(env.name)
+
+            cache = None
+            key = None
+            if (prefix is not None) and (not args.no_cache):
+                location = args.cache_url or get_cache_location(file)
+                if location is not None:
+                    if str(location) not in caches:
+                        caches[str(location)] = ResultCache(
+                            create_backend(
+                                location,
+                                os.environ.get("CONDA_HOOKS_CACHE_AUTHORIZATION"),
+                            ),
+                            args.cache_ttl,
+                        )
+                    cache = caches[str(location)]
+                    key = cache.get_key(file, prefix, args.pin)
+                    keys.setdefault(str(location), []).append(key)
+            jobs.append((file, env, prefix, cache, key))
+
+        # look up all cache entries of this run at once
+        for location, cache in caches.items():
+            cache.fetch(keys[location])
+
+        for file, env, prefix, cache, key in jobs:
+            if (cache is not None) and (key is not None) and (key in cache):
+                LOGGER.info("environment did not change (cached).")
+                continue
 
-            if env.exists():
-                for dep in env.get_installed_dependencies():
-                    if dep not in env.dependencies:
-                        LOGGER.error(f"found missing dependency: {dep}")
-                        new_env.dependencies.append(dep)
+            new_env = EnvironmentFile(file)
+            if prefix is not None:
+                if args.pin:
+                    for dep in new_env.update_pins(env.get_installed_pins(prefix)):
+                        LOGGER.error(f"updated pinned dependency: {dep}")
+                else:
+                    known_dependencies = set(env.dependencies)
+                    for dep in env.iter_installed_dependencies(prefix):
+                        if dep not in known_dependencies:
+                            LOGGER.error(f"found missing dependency: {dep}")
+                            known_dependencies.add(dep)
+                            new_env.dependencies.append(dep)
 
             new_env.dependencies.sort()
 
             if new_env != env:
                 LOGGER.error("environment changed!")
                 new_env.write()
+                if (cache is not None) and (prefix is not None):
+                    key = cache.get_key(file, prefix, args.pin)
             else:
                 LOGGER.info("environment did not change.")
+
+            if (cache is not None) and (key is not None):
+                cache.add(key, env.name)
+
+        for cache in caches.values():
+            cache.evict_expired()
     except CondaHookError as e:
         LOGGER.error(f"conda-hooks error: {e}")
 
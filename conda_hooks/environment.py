@@ -2,9 +2,10 @@ from __future__ import annotations
 
 import json
 import logging
+import re
 import subprocess
 from pathlib import Path
-from typing import Any
+from typing import IO, Any, Iterable, Iterator
 
 import yaml
 from yaml import CDumper as Dumper
@@ -23,6 +24,12 @@ ENV_DEFAULT_PATHS = [
 ]
 """Default names of the Anaconda environment file."""
 
+PACKAGE_NAME_REGEX = re.compile(r"^(?:[^:\s]+::)?([^\s=<>!~\[]+)")
+"""Regex to extract the package name (and skip the channel) of a dependency spec."""
+
+EXACT_PIN_REGEX = re.compile(r"^(?:[^:\s]+::)?[^\s=<>!~\[]+=[^\s=<>!~]+=[^\s=<>!~]+$")
+"""Regex matching exact pins of the form ``[channel::]name=version=build``."""
+
 
 class EnvironmentFile:
     def __init__(self, path: Path | str | None = None):
@@ -102,47 +109,136 @@ class EnvironmentFile:
         with open(path, "w") as fptr:
             yaml.dump(content, fptr, Dumper=Dumper)
 
+    def get_prefix(self) -> Path | None:
+        return get_env_prefixes().get(self.name)
+
     def exists(self) -> bool:
-        environments = json.loads(
-            subprocess.check_output(
-                [util.find_conda_executable(), "env", "list", "--quiet", "--json"],
-            )
-            .decode()
-            .strip(),
-        )["envs"]
-        for environment in environments:
-            if Path(environment).name == self.name:
-                return True
-
-        return False
+        return self.get_prefix() is not None
 
     def require_env_exists(self):
         if not self.exists():
             raise errors.EnvDoesNotExistError(self.name)
 
     def get_installed_dependencies(self) -> list[str]:
-        self.require_env_exists()
+        return sorted(self.iter_installed_dependencies())
 
-        exported_environment: dict[str, Any] = yaml.load(
-            subprocess.check_output(
-                [
-                    util.find_conda_executable(),
-                    "env",
-                    "export",
-                    "--from-history",
-                    "--quiet",
-                    "--name",
-                    self.name,
-                ],
-            ),
-            Loader=Loader,
-        )
+    def iter_installed_dependencies(
+        self,
+        prefix: Path | None = None,
+    ) -> Iterator[str]:
+        """Stream the dependencies reported by ``conda env export``.
 
-        dependencies = [
-            dependency for dependency in exported_environment.get("dependencies", [])
+        The output of conda is parsed incrementally while it is being read from the
+        pipe, dependencies are yielded in the order conda reports them.
+
+        Args:
+            prefix: Path of the environment. If given, the environment is assumed to
+                exist, otherwise this is checked with conda.
+
+        Raises:
+            EnvDoesNotExistError: If the environment does not exist.
+            subprocess.CalledProcessError: If the conda export fails.
+        """
+        if prefix is None:
+            self.require_env_exists()
+
+        cmd = [
+            str(util.find_conda_executable()),
+            "env",
+            "export",
+            "--from-history",
+            "--quiet",
+            "--name",
+            self.name,
         ]
-        dependencies.sort()
-        return dependencies
+        # unbuffered, so that the parser receives the output as soon as it is written
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=0) as process:
+            assert process.stdout is not None
+            yield from parse_exported_dependencies(process.stdout)
+            # consume any trailing output so that conda does not block on the pipe
+            process.stdout.read()
+
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, cmd)
+
+    def get_installed_pins(self, prefix: Path | None = None) -> list[str]:
+        """Get exact pins of all packages installed in the environment.
+
+        In contrast to :meth:`get_installed_dependencies` this includes transitive
+        dependencies. The pins are read directly from the ``conda-meta`` records of the
+        environment instead of calling conda.
+
+        Args:
+            prefix: Path of the environment (determined with conda if not given).
+
+        Raises:
+            EnvDoesNotExistError: If the environment does not exist.
+        """
+        if prefix is None:
+            prefix = self.get_prefix()
+        if prefix is None:
+            raise errors.EnvDoesNotExistError(self.name)
+
+        return sorted(read_conda_meta(prefix).values())
+
+    def update_pins(self, pins: Iterable[str]) -> list[str]:
+        """Update the dependencies of the file with the given exact pins.
+
+        Dependencies that are missing from the file are added, existing dependencies
+        are replaced by their pin. If the file contains multiple entries for a package,
+        the first one is replaced and the others are removed. An explicit channel of an
+        existing dependency is kept. Exact pins of packages that are not installed
+        anymore are removed.
+
+        Args:
+            pins: Pins of the installed packages in the form ``name=version=build``.
+
+        Returns:
+            The dependencies that were added, changed or removed.
+        """
+        pins_by_name = {get_package_name(pin): pin for pin in pins}
+
+        channels: dict[str, str] = {}
+        for dependency in self.dependencies:
+            if "::" in dependency:
+                channels.setdefault(
+                    get_package_name(dependency),
+                    dependency.split("::", 1)[0],
+                )
+
+        changed: list[str] = []
+        dependencies: list[str] = []
+        pinned: set[str] = set()
+        for dependency in self.dependencies:
+            name = get_package_name(dependency)
+            pin = pins_by_name.get(name)
+            if pin is None:
+                if EXACT_PIN_REGEX.match(dependency):
+                    # package is not installed anymore
+                    changed.append(dependency)
+                else:
+                    dependencies.append(dependency)
+                continue
+
+            if name in pinned:
+                # duplicate entry of a package that is already pinned
+                changed.append(dependency)
+                continue
+
+            pinned.add(name)
+            if name in channels:
+                pin = channels[name] + "::" + pin
+            dependencies.append(pin)
+            if dependency != pin:
+                changed.append(pin)
+
+        for name, pin in pins_by_name.items():
+            if name not in pinned:
+                dependencies.append(pin)
+                changed.append(pin)
+
+        self.dependencies = sorted(dependencies)
+        return changed
 
     def update_env(self):
         self.require_env_exists()
@@ -193,3 +289,109 @@ class EnvironmentFile:
                 self.name,
             ],
         )
+
+
+def parse_exported_dependencies(stream: IO[bytes] | IO[str]) -> Iterator[str]:
+    """Incrementally parse the dependencies of an exported environment.
+
+    Only the plain string entries of the top-level ``dependencies`` list are yielded,
+    nested entries (like ``pip`` dependencies) are skipped. The stream is consumed
+    event by event so that dependencies are available before the whole document has
+    been read.
+
+    Args:
+        stream: YAML document as produced by ``conda env export``.
+
+    Returns:
+        Iterator over the dependency specifications.
+    """
+    depth = 0
+    expect_key = True
+    key: str | None = None
+    in_dependencies = False
+
+    for event in yaml.parse(stream, Loader=Loader):
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            if depth == 1:
+                in_dependencies = (key == "dependencies") and isinstance(
+                    event,
+                    yaml.SequenceStartEvent,
+                )
+            depth += 1
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            depth -= 1
+            if depth == 1:
+                in_dependencies = False
+                expect_key = True
+        elif isinstance(event, yaml.ScalarEvent):
+            if depth == 1:
+                if expect_key:
+                    key = event.value
+                expect_key = not expect_key
+            elif depth == 2 and in_dependencies:
+                yield event.value
+
+
+def get_env_prefixes() -> dict[str, Path]:
+    """Get the prefixes of all conda environments with a single call to conda.
+
+    Returns:
+        Mapping from environment names to their prefixes.
+    """
+    environments = json.loads(
+        subprocess.check_output(
+            [util.find_conda_executable(), "env", "list", "--quiet", "--json"],
+        )
+        .decode()
+        .strip(),
+    )["envs"]
+
+    prefixes: dict[str, Path] = {}
+    for environment in environments:
+        prefixes.setdefault(Path(environment).name, Path(environment))
+    return prefixes
+
+
+def get_package_name(dependency: str) -> str:
+    """Extract the package name from a conda dependency spec.
+
+    Like conda, package names are case-insensitive and normalized to lower case.
+
+    Args:
+        dependency: Spec like ``numpy``, ``numpy>=1.20`` or ``conda-forge::numpy=1.20``.
+
+    Returns:
+        Name of the package.
+    """
+    match = PACKAGE_NAME_REGEX.match(dependency.strip())
+    if match is None:
+        raise errors.InvalidEnvFile(f"invalid dependency: {dependency}")
+    return match.group(1).lower()
+
+
+def _read_conda_meta_record(path: Path) -> tuple[str, str]:
+    try:
+        with open(path) as fptr:
+            record = json.load(fptr)
+        name = record["name"]
+        return name, "{}={}={}".format(name, record["version"], record["build"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise errors.InvalidCondaMetaRecord(path, repr(e)) from e
+
+
+def read_conda_meta(prefix: Path | str) -> dict[str, str]:
+    """Read the exact pins of all packages installed in a conda prefix.
+
+    Args:
+        prefix: Path of the conda environment.
+
+    Returns:
+        Mapping from package names to pins in the form ``name=version=build``.
+
+    Raises:
+        InvalidCondaMetaRecord: If a record in ``<prefix>/conda-meta`` is invalid.
+    """
+    return dict(
+        _read_conda_meta_record(path)
+        for path in sorted((Path(prefix) / "conda-meta").glob("*.json"))
+    )
@@ -35,3 +35,8 @@ class InvalidEnvFile(CondaHookError):
 class EnvDoesNotExistError(CondaHookError):
     def __init__(self, name: str):
         super().__init__(f"environment does not exist: {name}")
+
+
+class InvalidCondaMetaRecord(CondaHookError):
+    def __init__(self, path: str | Path, message: str):
+        super().__init__(f"invalid conda-meta record {path}: {message}")
@@ -0,0 +1,320 @@
+import json
+import os
+import socket
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+from util import TestDir
+
+from conda_hooks import cache
+
+
+def git(*args: str):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def test_get_blob_hash():
+    with TestDir(__file__):
+        expected = subprocess.check_output(
+            ["git", "hash-object", "environment.yml"],
+        ).decode()
+        assert cache.get_blob_hash("environment.yml") == expected.strip()
+
+
+def test_get_prefix_fingerprint():
+    with TestDir(__file__):
+        fingerprint = cache.get_prefix_fingerprint("prefix")
+        assert fingerprint == cache.get_prefix_fingerprint("prefix")
+        assert fingerprint != cache.get_prefix_fingerprint("does_not_exist")
+
+        Path("prefix/conda-meta/jinja2-3.1.2-pyhd8ed1ab_1.json").write_text("{}")
+        assert fingerprint != cache.get_prefix_fingerprint("prefix")
+
+
+def test_get_requested_specs_fingerprint():
+    with TestDir(__file__):
+        fingerprint = cache.get_requested_specs_fingerprint("prefix")
+        assert fingerprint != cache.get_requested_specs_fingerprint("does_not_exist")
+
+        with open("prefix/conda-meta/history", "a") as fptr:
+            fptr.write("==> 2023-03-02 12:00:00 <==\n")
+        assert fingerprint == cache.get_requested_specs_fingerprint("prefix")
+
+        with open("prefix/conda-meta/history", "a") as fptr:
+            fptr.write("# update specs: ['jinja2']\n")
+        assert fingerprint != cache.get_requested_specs_fingerprint("prefix")
+        fingerprint = cache.get_requested_specs_fingerprint("prefix")
+
+        with open("prefix/conda-meta/history", "a") as fptr:
+            fptr.write("# neutered specs: ['jinja2']\n")
+        assert fingerprint != cache.get_requested_specs_fingerprint("prefix")
+
+
+def test_get_git_common_dir():
+    with TestDir(__file__):
+        assert cache.get_result_cache("environment.yml") is None
+
+        git("init", "-q", "repo")
+        Path("repo/environment.yml").write_text(Path("environment.yml").read_text())
+        git("-C", "repo", "add", "environment.yml")
+        git("-C", "repo", "commit", "-q", "-m", "initial")
+        git("-C", "repo", "worktree", "add", "-q", "../worktree")
+
+        common_dir = Path("repo/.git").resolve()
+        assert cache.get_git_common_dir("repo/environment.yml") == common_dir
+        assert cache.get_git_common_dir("worktree/environment.yml") == common_dir
+
+        result_cache = cache.get_result_cache("worktree/environment.yml")
+        assert result_cache is not None
+        assert isinstance(result_cache.backend, cache.LocalCacheBackend)
+        assert result_cache.backend.directory == common_dir / "conda-hooks" / "results"
+
+
+def test_result_cache():
+    with TestDir(__file__):
+        result_cache = cache.ResultCache(cache.LocalCacheBackend("cache"))
+        key = result_cache.get_key("environment.yml", "prefix", False)
+        assert key != result_cache.get_key("environment.yml", "prefix", True)
+        assert key not in result_cache
+
+        result_cache.add(key, "conda_hooks_cache")
+        assert key in result_cache
+        assert key in cache.ResultCache(cache.create_backend("cache"))
+
+        pin_key = result_cache.get_key("environment.yml", "prefix", True)
+        with open("prefix/conda-meta/history", "a") as fptr:
+            fptr.write("# update specs: ['jinja2']\n")
+        assert result_cache.get_key("environment.yml", "prefix", False) != key
+        assert result_cache.get_key("environment.yml", "prefix", True) == pin_key
+        key = result_cache.get_key("environment.yml", "prefix", False)
+
+        with open("environment.yml", "a") as fptr:
+            fptr.write("  - numpy\n")
+        assert result_cache.get_key("environment.yml", "prefix", False) != key
+
+
+def test_local_cache_backend():
+    with TestDir(__file__):
+        backend = cache.LocalCacheBackend("cache")
+        backend.put("aabb", {"name": "forever"})
+        backend.put("ccdd", {"name": "valid"}, ttl=3600.0)
+        backend.put("eeff", {"name": "expired"}, ttl=0.0)
+        assert Path("cache/ee/ff").exists()
+
+        assert backend.get_many(["aabb", "ccdd", "eeff", "0011"]) == {
+            "aabb": {"name": "forever"},
+            "ccdd": {"name": "valid"},
+        }
+        assert not Path("cache/ee/ff").exists()
+
+
+def test_local_cache_backend_evict_expired():
+    with TestDir(__file__):
+        backend = cache.LocalCacheBackend("cache")
+        backend.evict_expired()
+
+        backend.put("aabb", {"name": "forever"})
+        backend.put("ccdd", {"name": "valid"}, ttl=3600.0)
+        backend.put("eeff", {"name": "expired"}, ttl=0.0)
+        Path("cache/00").mkdir()
+        Path("cache/00/11").write_text("not json")
+        Path("cache/00/.tmp-leftover").touch()
+        os.utime("cache/00/.tmp-leftover", (0, 0))
+
+        # entries are removed without being read by get_many
+        backend.evict_expired()
+        assert sorted(str(path) for path in Path("cache").glob("*/*")) == [
+            str(Path("cache/aa/bb")),
+            str(Path("cache/cc/dd")),
+        ]
+        assert backend.get_many(["aabb", "ccdd"]) == {
+            "aabb": {"name": "forever"},
+            "ccdd": {"name": "valid"},
+        }
+
+
+class CacheServer(HTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), CacheRequestHandler)
+        self.entries: dict = {}
+        self.requests: list = []
+        self.batch_body: bytes | None = None
+        self.batch_supported = True
+        self.authorization: list = []
+
+    @property
+    def url(self) -> str:
+        return "http://{}:{}/cache".format(*self.server_address)
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    server: CacheServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        return json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        directory, key = self.path.rsplit("/", 1)
+        entry = self.server.entries.get(key)
+        if (directory != "/cache") or (entry is None):
+            self.send_error(404)
+            return
+
+        body = json.dumps(entry).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_PUT(self):
+        self.server.authorization.append(self.headers.get("Authorization"))
+        self.server.requests.append(("PUT", self.path))
+        self.server.entries[self.path.rsplit("/", 1)[-1]] = self._read_body()
+        self.send_response(200)
+        self.end_headers()
+
+    def do_POST(self):
+        self.server.requests.append(("POST", self.path))
+        if (self.path != "/cache/_batch") or not self.server.batch_supported:
+            self.send_error(404)
+            return
+
+        entries = self.server.entries
+        keys = self._read_body()["keys"]
+        body = json.dumps(
+            {key: entries[key] for key in keys if key in entries}
+        ).encode()
+        if self.server.batch_body is not None:
+            body = self.server.batch_body
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_http_cache_backend():
+    server = CacheServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        backend = cache.create_backend(server.url)
+        assert isinstance(backend, cache.HttpCacheBackend)
+
+        backend.put("aabb", {"name": "forever"})
+        backend.put("eeff", {"name": "expired"}, ttl=0.0)
+        assert server.requests == [("PUT", "/cache/aabb"), ("PUT", "/cache/eeff")]
+
+        result_cache = cache.ResultCache(backend)
+        server.requests.clear()
+        result_cache.fetch(["aabb", "ccdd", "eeff"])
+        assert server.requests == [("POST", "/cache/_batch")]
+
+        assert "aabb" in result_cache
+        assert "ccdd" not in result_cache
+        assert "eeff" not in result_cache
+        assert len(server.requests) == 1
+
+        unreachable = cache.HttpCacheBackend(server.url + "/missing")
+        assert unreachable.get_many(["aabb"]) == {}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http_cache_backend_malformed_response():
+    server = CacheServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        backend = cache.HttpCacheBackend(server.url)
+        for body in [
+            b"not json",
+            b"[1, 2, 3]",
+            b'{"aabb": {"name": "no value"}}',
+            b'{"aabb": {"value": "no dict"}, "ccdd": 42}',
+            b'{"aabb": {"value": {}, "expires": "never"}}',
+        ]:
+            server.batch_body = body
+            assert backend.get_many(["aabb", "ccdd"]) == {}
+
+        server.batch_body = b'{"aabb": {"value": {"name": "valid"}, "expires": null}}'
+        assert backend.get_many(["aabb"]) == {"aabb": {"name": "valid"}}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http_cache_backend_broken_server():
+    # a server that answers with garbage instead of a HTTP status line
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen()
+
+    def serve():
+        for _ in range(2):
+            connection, _ = sock.accept()
+            with connection:
+                connection.recv(65536)
+                connection.sendall(b"garbage\r\n\r\n")
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    try:
+        backend = cache.HttpCacheBackend("http://{}:{}".format(*sock.getsockname()))
+        assert backend.get_many(["aabb"]) == {}
+        backend.put("aabb", {"name": "value"})
+    finally:
+        thread.join(timeout=10)
+        sock.close()
+
+
+def test_local_cache_backend_put_error(monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError("failure")
+
+    with TestDir(__file__):
+        backend = cache.LocalCacheBackend("cache")
+        with monkeypatch.context() as patch:
+            patch.setattr(os, "replace", fail)
+            patch.setattr(os, "unlink", fail)
+            backend.put("aabb", {"name": "value"})
+        assert backend.get_many(["aabb"]) == {}
+
+
+def test_http_cache_backend_without_batch():
+    server = CacheServer()
+    server.batch_supported = False
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        backend = cache.create_backend(server.url, "Bearer secret")
+        backend.put("aabb", {"name": "value"})
+        assert server.authorization == ["Bearer secret"]
+
+        server.requests.clear()
+        assert backend.get_many(["aabb", "ccdd"]) == {"aabb": {"name": "value"}}
+        assert server.requests == [
+            ("POST", "/cache/_batch"),
+            ("GET", "/cache/aabb"),
+            ("GET", "/cache/ccdd"),
+        ]
+
+        # the batch endpoint is not tried again
+        server.requests.clear()
+        assert backend.get_many(["aabb"]) == {"aabb": {"name": "value"}}
+        assert server.requests == [("GET", "/cache/aabb")]
+    finally:
+        server.shutdown()
+        server.server_close()
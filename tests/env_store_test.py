@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import os
 import subprocess
+import sys
 from pathlib import Path
 
 from util import TestDir
 
-from conda_hooks import env_store, environment, util
+from conda_hooks import cache, env_store, environment, util
+from conda_hooks.environment import EnvironmentFile
 
 
 def test_get_env_files():
@@ -113,3 +115,124 @@ def test_main():
         stored_env.remove()
         os.remove("environment.yml")
         env_store.main([])
+
+
+def test_main_pin(monkeypatch):
+    monkeypatch.delenv("CONDA_HOOKS_CACHE_URL", raising=False)
+    monkeypatch.setattr(
+        env_store,
+        "get_env_prefixes",
+        lambda: {"conda_hooks_default": Path("prefix")},
+    )
+    monkeypatch.setattr(
+        EnvironmentFile,
+        "get_installed_pins",
+        lambda self, prefix: [
+            "black=23.1.0=py311h38be061_0",
+            "python=3.11.0=he550d4f_1",
+        ],
+    )
+
+    def iter_installed_dependencies(self):
+        raise AssertionError("conda env export should not be called with --pin")
+
+    monkeypatch.setattr(
+        EnvironmentFile,
+        "iter_installed_dependencies",
+        iter_installed_dependencies,
+    )
+
+    with TestDir(__file__):
+        env_store.main(["--pin", "--no-cache"])
+        new_env = environment.EnvironmentFile()
+        assert new_env.dependencies == [
+            "black=23.1.0=py311h38be061_0",
+            "mypy",
+            "pip",
+            "python=3.11.0=he550d4f_1",
+        ]
+        assert new_env.pip_dependencies == ["isort", "pre-commit"]
+
+
+def test_main_cache(monkeypatch):
+    monkeypatch.delenv("CONDA_HOOKS_CACHE_URL", raising=False)
+    env_lists = []
+
+    def get_env_prefixes():
+        env_lists.append(True)
+        return {"conda_hooks_default": Path("prefix")}
+
+    monkeypatch.setattr(env_store, "get_env_prefixes", get_env_prefixes)
+
+    exports = []
+
+    def iter_installed_dependencies(self, prefix=None):
+        exports.append(self.name)
+        yield from ["python", "jinja2"]
+
+    monkeypatch.setattr(
+        EnvironmentFile,
+        "iter_installed_dependencies",
+        iter_installed_dependencies,
+    )
+
+    with TestDir(__file__):
+        subprocess.run(["git", "init", "-q"], check=True)
+        result_cache = cache.get_result_cache("environment.yml")
+        assert result_cache is not None
+        old_key = result_cache.get_key("environment.yml", "prefix", False)
+
+        # file is rewritten, the key of the new file is stored
+        env_store.main([])
+        assert len(exports) == 1
+        assert "jinja2" in environment.EnvironmentFile().dependencies
+        new_key = result_cache.get_key("environment.yml", "prefix", False)
+        assert new_key != old_key
+        assert new_key in cache.get_result_cache("environment.yml")
+        assert old_key not in cache.get_result_cache("environment.yml")
+
+        # unchanged file and prefix, export is skipped
+        env_store.main([])
+        assert len(exports) == 1
+        assert len(env_lists) == 2
+
+        # cache disabled, export is run again
+        env_store.main(["--no-cache"])
+        assert len(exports) == 2
+
+
+FAKE_CONDA = """#!{executable}
+import json
+import sys
+
+with open({log!r}, "a") as fptr:
+    fptr.write(" ".join(sys.argv[1:3]) + "\\n")
+
+if sys.argv[1:3] == ["env", "list"]:
+    print(json.dumps({{"envs": ["/opt/conda/envs/conda_hooks_default"]}}))
+elif sys.argv[1:3] == ["env", "export"]:
+    print("name: conda_hooks_default\\ndependencies:\\n  - python\\n  - jinja2")
+"""
+
+
+def test_main_duplicate_file(monkeypatch):
+    monkeypatch.delenv("CONDA_HOOKS_CACHE_URL", raising=False)
+
+    with TestDir(__file__):
+        log = Path("conda.log").resolve()
+        conda = Path("conda").resolve()
+        conda.write_text(FAKE_CONDA.format(executable=sys.executable, log=str(log)))
+        conda.chmod(0o755)
+        monkeypatch.setattr(
+            util,
+            "find_conda_executable",
+            lambda allow_mamba=False: conda,
+        )
+
+        # the same file is matched by the pattern and explicitly
+        env_store.main(["-g", "*.yml", "environment.yml"])
+        dependencies = environment.EnvironmentFile().dependencies
+        assert dependencies.count("jinja2") == 1
+
+        # conda is only asked once for the list of environments
+        assert log.read_text().splitlines() == ["env list", "env export"]
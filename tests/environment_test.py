@@ -1,5 +1,7 @@
 import os
 import subprocess
+import sys
+import time
 from pathlib import Path
 
 import pytest
@@ -125,3 +127,93 @@ def test_get_installed_dependencies():
         assert env.get_installed_dependencies() == ["black", "jinja2", "mypy", "python"]
 
         env.remove()
+
+
+def test_parse_exported_dependencies():
+    with TestDir(__file__):
+        with open("exported.yml", "rb") as fptr:
+            dependencies = list(environment.parse_exported_dependencies(fptr))
+        assert dependencies == ["python=3.9", "mypy", "black"]
+
+
+def test_get_package_name():
+    assert environment.get_package_name("numpy") == "numpy"
+    assert environment.get_package_name("numpy>=1.20") == "numpy"
+    assert environment.get_package_name("numpy 1.20 py_0") == "numpy"
+    assert environment.get_package_name("conda-forge::numpy=1.20") == "numpy"
+    assert environment.get_package_name("python=3.11.0=he550d4f_1") == "python"
+    assert environment.get_package_name("PyYAML>=6") == "pyyaml"
+
+
+def test_read_conda_meta():
+    with TestDir(__file__):
+        assert environment.read_conda_meta("prefix") == {
+            "libzlib": "libzlib=1.2.13=h166bdaf_4",
+            "numpy": "numpy=1.24.2=py311h8e6699e_0",
+            "python": "python=3.11.0=he550d4f_1_cpython",
+        }
+        assert environment.read_conda_meta("does_not_exist") == {}
+
+        Path("prefix/conda-meta/broken-1.0-0.json").write_text('{"name": "bro')
+        with pytest.raises(errors.InvalidCondaMetaRecord, match="broken-1.0-0.json"):
+            environment.read_conda_meta("prefix")
+
+        Path("prefix/conda-meta/broken-1.0-0.json").write_text('{"name": "broken"}')
+        with pytest.raises(errors.InvalidCondaMetaRecord, match="broken-1.0-0.json"):
+            environment.read_conda_meta("prefix")
+
+
+def test_update_pins():
+    with TestDir(__file__):
+        env = environment.EnvironmentFile("pins.yml")
+        changed = env.update_pins(environment.read_conda_meta("prefix").values())
+        assert changed == [
+            "libzlib=1.2.13=h166bdaf_4",
+            "conda-forge::numpy=1.24.2=py311h8e6699e_0",
+            "libstale=1.0=h0_0",
+            "python>=3.9",
+        ]
+        assert env.dependencies == [
+            "conda-forge::numpy=1.24.2=py311h8e6699e_0",
+            "libzlib=1.2.13=h166bdaf_4",
+            "python=3.11.0=he550d4f_1_cpython",
+            "scipy",
+        ]
+        assert env.pip_dependencies == ["requests"]
+        assert env.update_pins(environment.read_conda_meta("prefix").values()) == []
+
+
+SLOW_EXPORT = """
+import sys
+import time
+
+sys.stdout.write("name: conda_hooks_slow\\ndependencies:\\n  - python\\n  - mypy\\n")
+sys.stdout.flush()
+time.sleep(2.0)
+sys.stdout.write("  - black\\nprefix: /opt/conda/envs/conda_hooks_slow\\n")
+"""
+
+
+def test_iter_installed_dependencies_streaming(monkeypatch):
+    with TestDir(__file__):
+        Path("slow_export.py").write_text(SLOW_EXPORT)
+        Path("conda").write_text(
+            f"#!/bin/sh\nexec {sys.executable} {Path('slow_export.py').resolve()}\n",
+        )
+        Path("conda").chmod(0o755)
+        monkeypatch.setattr(
+            util, "find_conda_executable", lambda: Path("conda").resolve()
+        )
+        monkeypatch.setattr(
+            environment.EnvironmentFile,
+            "require_env_exists",
+            lambda self: None,
+        )
+
+        env = environment.EnvironmentFile("small.yml")
+        start = time.monotonic()
+        dependencies = env.iter_installed_dependencies()
+        assert next(dependencies) == "python"
+        assert time.monotonic() - start < 1.0
+        assert list(dependencies) == ["mypy", "black"]
+        assert time.monotonic() - start >= 2.0